@@ -6,6 +6,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import functools
 import inspect
+import weakref
 
 import numpy as np
 
@@ -56,12 +57,25 @@ def Selection(func):
     """Class factory for TOA selection."""
 
     class Selection(object):
+        # masks depend only on the pulsar, so share them across the
+        # instances made for each signal; weak keys let pulsars be freed
+        _mask_cache = weakref.WeakKeyDictionary()
+
         def __init__(self, psr):
             self._psr = psr
 
         @property
         def masks(self):
-            return selection_func(func)(psr=self._psr)
+            # key on the TOA vector as well as the pulsar object, so that
+            # in-place modifications like Pulsar.filter_data invalidate
+            # the cached masks
+            toas = self._psr.toas
+            key = (len(toas), toas[0], toas[-1])
+            cached = self._mask_cache.get(self._psr)
+            if cached is None or cached[0] != key:
+                cached = (key, selection_func(func)(psr=self._psr))
+                self._mask_cache[self._psr] = cached
+            return cached[1]
 
         def _get_masked_array_dict(self, masks, arr):
             return {key: val * arr for key, val in masks.items()}
@@ -1063,6 +1063,99 @@ class BlockMatrix(object):
         return (ret, self._get_logdet()) if logdet else ret
 
 
+class RankOneBlockMatrix(BlockMatrix):
+    """Specialization of ``BlockMatrix`` for blocks that are rank-one
+    outer products :math:`J_k 11^T`, stored implicitly as ``(nb, jv)``
+    pairs. Solves and log determinants use the per-block
+    Sherman-Morrison identity, so no dense blocks are materialized and
+    each block costs O(nb) instead of O(nb^3).
+    """
+
+    def __add__(self, other):
+        nvec = self._nvec + other
+        return RankOneBlockMatrix(self._blocks, self._slices, nvec)
+
+    # hacky way to fix adding 0
+    def __radd__(self, other):
+        if other == 0:
+            return self.__add__(other)
+        else:
+            raise TypeError
+
+    def matvec(self, x):
+        """Returns :math:`(N + UJU^{T})x`, exploiting the rank-one
+        blocks; costs O(n) rather than O(sum nb^2).
+        """
+        y = self._nvec * x
+        for slc, (nb, jv) in zip(self._slices, self._blocks):
+            y[slc] += jv * x[slc].sum()
+        return y
+
+    def _block_solve(self, slc, jv, Xblock):
+        """Solves :math:`(D + J 11^T)^{-1}X` for one block, with
+        :math:`D` the diagonal of ``nvec`` over the block.
+        """
+        niblock = 1 / self._nvec[slc]
+        beta = 1.0 / (np.einsum("i->", niblock) + 1.0 / jv)
+        return niblock[:, None] * Xblock - beta * np.outer(niblock, np.dot(niblock, Xblock))
+
+    def _solve_ZNX(self, X, Z):
+        """Solves :math:`Z^T N^{-1}X`, where :math:`X`
+        and :math:`Z` are 1-d or 2-d arrays.
+        """
+        if X.ndim == 1:
+            X = X.reshape(X.shape[0], 1)
+        if Z.ndim == 1:
+            Z = Z.reshape(Z.shape[0], 1)
+
+        n, m = Z.shape[1], X.shape[1]
+        ZNX = np.zeros((n, m))
+        if len(self._idx) > 0:
+            ZNXr = np.dot(Z[self._idx, :].T, X[self._idx, :] / self._nvec[self._idx, None])
+        else:
+            ZNXr = 0
+        for slc, (nb, jv) in zip(self._slices, self._blocks):
+            Zblock = Z[slc, :]
+            Xblock = X[slc, :]
+
+            if nb > 1:
+                bx = self._block_solve(slc, jv, Xblock)
+            else:
+                bx = Xblock / self._nvec[slc][:, None]
+            ZNX += np.dot(Zblock.T, bx)
+        ZNX += ZNXr
+        return ZNX.squeeze() if ZNX.size > 1 else float(ZNX[0, 0])
+
+    def _solve_NX(self, X):
+        """Solves :math:`N^{-1}X`, where :math:`X`
+        is a 1-d or 2-d array.
+        """
+        if X.ndim == 1:
+            X = X.reshape(X.shape[0], 1)
+
+        NX = X / self._nvec[:, None]
+        for slc, (nb, jv) in zip(self._slices, self._blocks):
+            if nb > 1:
+                NX[slc] = self._block_solve(slc, jv, X[slc, :])
+        return NX.squeeze()
+
+    def _get_logdet(self):
+        """Returns log determinant of :math:`N+UJU^{T}` where :math:`U`
+        is a quantization matrix.
+        """
+        if len(self._idx) > 0:
+            logdet = np.sum(np.log(self._nvec[self._idx]))
+        else:
+            logdet = 0
+        for slc, (nb, jv) in zip(self._slices, self._blocks):
+            logdet += np.sum(np.log(self._nvec[slc]))
+            if nb > 1:
+                niblock = 1 / self._nvec[slc]
+                beta = 1.0 / (np.einsum("i->", niblock) + 1.0 / jv)
+                logdet += np.log(jv) - np.log(beta)
+        return logdet
+
+
 class ShermanMorrison(object):
     """Custom container class for Sherman-morrison array inversion."""
 
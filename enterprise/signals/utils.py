@@ -33,6 +33,56 @@ try:
 except:
     print("You'll need sksparse for get_coefficients() with common signals!")
 
+try:
+    from numba import njit
+
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+
+if HAVE_NUMBA:
+
+    @njit(cache=True)
+    def _quantize_buckets(toas, isort, dt):  # pragma: no cover
+        """Assign each TOA to an observing-epoch bucket, walking the TOAs
+        in time order; returns the bucket index per TOA and the number of
+        buckets.
+        """
+        bucket = np.empty(toas.shape[0], dtype=np.int64)
+        ref = toas[isort[0]]
+        nb = 0
+        bucket[isort[0]] = 0
+        for kk in range(1, isort.shape[0]):
+            ii = isort[kk]
+            if toas[ii] - ref >= dt:
+                nb += 1
+                ref = toas[ii]
+            bucket[ii] = nb
+        return bucket, nb + 1
+
+    @njit(cache=True)
+    def _column_extents(U):  # pragma: no cover
+        """First nonzero row, last nonzero row + 1, and nonzero count for
+        each column of a quantization matrix.
+        """
+        nrow, ncol = U.shape
+        start = np.empty(ncol, dtype=np.int64)
+        stop = np.empty(ncol, dtype=np.int64)
+        count = np.zeros(ncol, dtype=np.int64)
+        for jj in range(ncol):
+            first, last, nn = -1, -1, 0
+            for ii in range(nrow):
+                if U[ii, jj] != 0:
+                    if first < 0:
+                        first = ii
+                    last = ii
+                    nn += 1
+            start[jj] = first
+            stop[jj] = last + 1
+            count[jj] = nn
+        return start, stop, count
+
 
 def get_coefficients(pta, params, n=1, phiinv_method="cliques", common_sparse=False):
     ret = []
@@ -666,22 +716,36 @@ def create_quantization_matrix(toas, dt=1, nmin=2):
     """Create quantization matrix mapping TOAs to observing epochs."""
     isort = np.argsort(toas)
 
-    bucket_ref = [toas[isort[0]]]
-    bucket_ind = [[isort[0]]]
+    if HAVE_NUMBA:
+        bucket, nbucket = _quantize_buckets(np.ascontiguousarray(toas, dtype="d"), isort, dt)
 
-    for i in isort[1:]:
-        if toas[i] - bucket_ref[-1] < dt:
-            bucket_ind[-1].append(i)
-        else:
-            bucket_ref.append(toas[i])
-            bucket_ind.append([i])
+        # keep only epochs with at least nmin TOAs, preserving time order
+        counts = np.bincount(bucket, minlength=nbucket)
+        keep = np.flatnonzero(counts >= nmin)
+        colmap = np.full(nbucket, -1)
+        colmap[keep] = np.arange(len(keep))
 
-    # find only epochs with more than 1 TOA
-    bucket_ind2 = [ind for ind in bucket_ind if len(ind) >= nmin]
+        U = np.zeros((len(toas), len(keep)), "d")
+        cols = colmap[bucket]
+        rows = np.flatnonzero(cols >= 0)
+        U[rows, cols[rows]] = 1
+    else:
+        bucket_ref = [toas[isort[0]]]
+        bucket_ind = [[isort[0]]]
 
-    U = np.zeros((len(toas), len(bucket_ind2)), "d")
-    for i, l in enumerate(bucket_ind2):
-        U[l, i] = 1
+        for i in isort[1:]:
+            if toas[i] - bucket_ref[-1] < dt:
+                bucket_ind[-1].append(i)
+            else:
+                bucket_ref.append(toas[i])
+                bucket_ind.append([i])
+
+        # find only epochs with more than 1 TOA
+        bucket_ind2 = [ind for ind in bucket_ind if len(ind) >= nmin]
+
+        U = np.zeros((len(toas), len(bucket_ind2)), "d")
+        for i, l in enumerate(bucket_ind2):
+            U[l, i] = 1
 
     weights = np.ones(U.shape[1])
 
@@ -699,6 +763,12 @@ def quant2ind(U):
     .. note:: This function assumes that the pulsar TOAs were sorted by time.
 
     """
+    if HAVE_NUMBA:
+        start, stop, count = _column_extents(np.ascontiguousarray(U, dtype="d"))
+        if np.any(stop - start != count):
+            raise ValueError("ERROR: TOAs not sorted properly!")
+        return [slice(int(ss), int(ee)) for ss, ee in zip(start, stop)]
+
     inds = []
     for cc, col in enumerate(U.T):
         epinds = np.flatnonzero(col)
@@ -5,6 +5,9 @@ defined as the class of signals that only modifies the white noise matrix `N`.
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import logging
+import weakref
+
 import numpy as np
 import scipy.sparse
 
@@ -12,6 +15,24 @@ from enterprise.signals import parameter, selections, signal_base, utils
 from enterprise.signals.parameter import function
 from enterprise.signals.selections import Selection
 
+logger = logging.getLogger(__name__)
+
+# quantization matrices depend only on the pulsar and the selection mask,
+# so share them across the ECORR signals built for a given pulsar
+_quantization_cache = weakref.WeakKeyDictionary()
+
+
+def _cached_quantization(psr, mask, nmin=2):
+    """Memoized ``utils.create_quantization_matrix(psr.toas[mask], nmin)``."""
+    cache = _quantization_cache.setdefault(psr, {})
+    # include the TOA vector in the key, so in-place modifications like
+    # Pulsar.filter_data do not serve stale quantization matrices
+    toas = psr.toas
+    key = (mask.tobytes(), nmin, len(toas), toas[0], toas[-1])
+    if key not in cache:
+        cache[key] = utils.create_quantization_matrix(toas[mask], nmin=nmin)
+    return cache[key]
+
 
 def WhiteNoise(varianceFunction, selection=Selection(selections.no_selection), name=""):
     """ Class factory for generic white noise signals."""
@@ -27,15 +48,28 @@ def WhiteNoise(varianceFunction, selection=Selection(selections.no_selection), n
             self._do_selection(psr, varianceFunction, selection)
 
         def _do_selection(self, psr, vfn, selection):
-            sel = selection(psr)
-            self._keys = list(sorted(sel.masks.keys()))
-            self._masks = [sel.masks[key] for key in self._keys]
+            masks = selection(psr).masks
+            self._keys = tuple(sorted(masks.keys()))
+            self._masks = tuple(masks[key] for key in self._keys)
+            self._ntoas = len(psr.toas)
+            # integer indices of each selection group, so that get_ndiag can
+            # scatter per-group variances instead of accumulating masked
+            # full-length vectors; int32 halves the index traffic and is
+            # plenty for TOA counts
+            self._idx = [np.flatnonzero(mask).astype(np.int32) for mask in self._masks]
+            # groups from the standard selections are disjoint, so if they
+            # cover every TOA the scatter fills the whole output vector
+            self._covered = sum(idx.size for idx in self._idx) == self._ntoas
+            # fused scatter layout: one flat index array with group offsets,
+            # so get_ndiag issues a single scatter instead of one per group
+            self._idx_flat = np.concatenate(self._idx) if self._idx else np.array([], dtype=np.int32)
+            self._group_ptr = np.concatenate(([0], np.cumsum([idx.size for idx in self._idx])))
             self._ndiag, self._params = {}, {}
             for key, mask in zip(self._keys, self._masks):
                 pnames = [psr.name, name, key]
                 pname = "_".join([n for n in pnames if n])
                 self._ndiag[key] = vfn(pname, psr=psr)
-                for param in list(self._ndiag[key]._params.values()):
+                for param in self._ndiag[key]._params.values():
                     self._params[param.name] = param
 
         @property
@@ -45,35 +79,53 @@ def WhiteNoise(varianceFunction, selection=Selection(selections.no_selection), n
 
         @signal_base.cache_call("ndiag_params")
         def get_ndiag(self, params):
-            ret = 0
-            for key, mask in zip(self._keys, self._masks):
-                ret += self._ndiag[key](params=params) * mask
+            # collect the per-group variances contiguously (the mask
+            # restricts each variance function to the TOAs of its group,
+            # and scalars broadcast over their segment) ...
+            vals = np.empty(self._idx_flat.size)
+            for gg, (key, mask) in enumerate(zip(self._keys, self._masks)):
+                vals[self._group_ptr[gg] : self._group_ptr[gg + 1]] = self._ndiag[key](params=params, mask=mask)
+
+            # ... then place them with one fused scatter; a persistent
+            # output buffer would alias into the cache_call entries
+            # (limit=2), so allocate per cache miss, zero-filling only when
+            # the selection does not cover every TOA
+            ret = np.empty(self._ntoas) if self._covered else np.zeros(self._ntoas)
+            ret[self._idx_flat] = vals
             return signal_base.ndarray_alt(ret)
 
     return WhiteNoise
 
 
 @function
-def efac_ndiag(toaerrs, efac=1.0):
-    return efac ** 2 * toaerrs ** 2
+def efac_ndiag(toaerrs=None, efac=1.0, toaerrs2=None):
+    return efac ** 2 * (toaerrs2 if toaerrs2 is not None else toaerrs ** 2)
 
 
 def MeasurementNoise(efac=parameter.Uniform(0.5, 1.5), selection=Selection(selections.no_selection), name=""):
     """Class factory for EFAC type measurement noise."""
 
-    varianceFunction = efac_ndiag(efac=efac)
+    varianceFunction = efac_ndiag(efac=efac, toaerrs=None, toaerrs2=None)
     BaseClass = WhiteNoise(varianceFunction, selection=selection, name=name)
 
     class MeasurementNoise(BaseClass):
         signal_name = "efac"
         signal_id = "efac_" + name if name else "efac"
 
+        def _do_selection(self, psr, vfn, selection):
+            super(MeasurementNoise, self)._do_selection(psr, vfn, selection)
+            # the squared TOA errors of each group are constants of the
+            # pulsar, so bind them once rather than resquaring per call
+            for key, mask in zip(self._keys, self._masks):
+                self._ndiag[key].add_kwarg(toaerrs2=psr.toaerrs[mask] ** 2)
+
     return MeasurementNoise
 
 
 @function
-def equad_ndiag(toas, log10_equad=-8):
-    return np.ones_like(toas) * 10 ** (2 * log10_equad)
+def equad_ndiag(log10_equad=-8):
+    # scalar variance; get_ndiag broadcasts it over the selection group
+    return 10 ** (2 * log10_equad)
 
 
 def EquadNoise(log10_equad=parameter.Uniform(-10, -5), selection=Selection(selections.no_selection), name=""):
@@ -101,7 +153,8 @@ def EcorrKernelNoise(
     :param selection:
         ``Selection`` object specifying masks for backends, time segments, etc.
     :param method: Method for computing noise covariance matrix.
-        Options include `sherman-morrison`, `sparse`, and `block`
+        Options include `sherman-morrison`, `sparse`, `sparse-csc`,
+        and `block`
 
     :return: ``EcorrKernelNoise`` class.
 
@@ -115,7 +168,7 @@ def EcorrKernelNoise(
     this covariance is block diagonal, thus allowing us to exploit special
     methods to make matrix manipulations easier.
 
-    In this signal implementation we offer three methods of performing these
+    In this signal implementation we offer five methods of performing these
     matrix operations:
 
     sherman-morrison
@@ -124,17 +177,29 @@ def EcorrKernelNoise(
         be used for covariances that can be constructed by the outer product
         of two vectors, :math:`uv^T`.
 
+    auto
+        Picks between `sherman-morrison` and the rank-one block operator
+        per pulsar, based on the epoch block-size statistics.
+
     sparse
+        Uses a lightweight block operator that exploits the rank-one
+        structure of each epoch block, so matrix operations cost O(n)
+        rather than scaling with the squared block sizes.
+
+    sparse-csc
         Uses `Scipy Sparse`_ matrices to construct the block diagonal
-        covariance matrix and perform matrix operations.
+        covariance matrix and perform matrix operations. Use this if
+        external code requires an actual scipy sparse handle.
 
     block
         Uses a custom scheme that uses the individual blocks from the block
         diagonal matrix to perform fast matrix inverse and other solve
         operations.
 
-    .. note:: The sherman-morrison method is the fastest, followed by the block
-        and then sparse methods, however; the block and sparse methods are more
+    .. note:: The sherman-morrison, sparse, and block methods all solve in
+        O(n) via per-block Sherman-Morrison identities and perform similarly;
+        sparse-csc pays for assembling and factorizing an actual scipy sparse
+        matrix and is the slowest. The block and sparse methods are more
         general and should be used if sub-classing this signal for more
         complicated blocks.
 
@@ -144,7 +209,7 @@ def EcorrKernelNoise(
 
     """
 
-    if method not in ["sherman-morrison", "block", "sparse"]:
+    if method not in ["sherman-morrison", "block", "sparse", "sparse-csc", "auto"]:
         msg = "EcorrKernelNoise does not support method: {}".format(method)
         raise TypeError(msg)
 
@@ -159,22 +224,46 @@ def EcorrKernelNoise(
 
             sel = selection(psr)
             self._params, self._masks = sel("log10_ecorr", log10_ecorr)
-            keys = list(sorted(self._masks.keys()))
+            keys = sorted(self._masks.keys())
             masks = [self._masks[key] for key in keys]
 
             Umats = []
             for key, mask in zip(keys, masks):
-                Umats.append(utils.create_quantization_matrix(psr.toas[mask], nmin=2)[0])
+                Umats.append(_cached_quantization(psr, mask, nmin=2)[0])
 
-            nepoch = np.sum(U.shape[1] for U in Umats)
-            U = np.zeros((len(psr.toas), nepoch))
+            # assemble the epoch slices one key at a time, so peak memory is
+            # set by the largest per-key quantization matrix rather than the
+            # full ntoa x nepoch matrix
             self._slices = {}
-            netot = 0
             for ct, (key, mask) in enumerate(zip(keys, masks)):
-                nn = Umats[ct].shape[1]
-                U[mask, netot : nn + netot] = Umats[ct]
-                self._slices.update({key: utils.quant2ind(U[:, netot : nn + netot])})
-                netot += nn
+                Ukey = np.zeros((len(psr.toas), Umats[ct].shape[1]))
+                Ukey[mask] = Umats[ct]
+                # drop degenerate single-TOA epochs (possible when
+                # sub-classing with nmin=1); every solve path ignores them
+                slices = [slc for slc in utils.quant2ind(Ukey) if slc.stop - slc.start > 1]
+                self._slices.update({key: slices})
+
+            # cache the flattened epoch structure used by _get_jvecs
+            self._sorted_keys = sorted(self._slices.keys())
+            self._slice_list = [slc for key in self._sorted_keys for slc in self._slices[key]]
+            self._counts = np.array([len(self._slices[key]) for key in self._sorted_keys], dtype=np.int64)
+
+            # resolve 'auto' per pulsar from the epoch block-size stats:
+            # uniform blocks do fine with plain Sherman-Morrison, while
+            # skewed distributions favor the rank-one block operator
+            self._method = method
+            if method == "auto":
+                nbs = np.array([slc.stop - slc.start for slc in self._slice_list])
+                if nbs.size == 0 or nbs.max() <= 4 * nbs.mean():
+                    self._method = "sherman-morrison"
+                else:
+                    self._method = "block"
+                msg = "{}: auto ECORR method resolved to {}".format(self.name, self._method)
+                logger.info(msg)
+
+            # persistent solve operators; _get_jvecs rebinds their jvec
+            self._sm = None
+            self._rank1 = None
 
             # initialize sparse matrix
             self._setup(psr)
@@ -184,54 +273,96 @@ def EcorrKernelNoise(
             """Get any varying ndiag parameters."""
             return [pp.name for pp in self.params]
 
-        @signal_base.cache_call("ndiag_params")
         def get_ndiag(self, params):
-            if method == "sherman-morrison":
+            # not cache_call decorated: the persistent operators below are
+            # rebound to the (cached) jvec per call, and caching the shared
+            # objects themselves would serve stale values after a revert
+            if self._method == "sherman-morrison":
                 return self._get_ndiag_sherman_morrison(params)
-            elif method == "sparse":
+            elif self._method == "sparse":
+                # the rank-one block operator does the same job as the CSC
+                # matrix in O(n); the CSC form survives as 'sparse-csc' for
+                # code that needs a scipy sparse handle
+                return self._get_ndiag_block(params)
+            elif self._method == "sparse-csc":
                 return self._get_ndiag_sparse(params)
-            elif method == "block":
+            elif self._method == "block":
                 return self._get_ndiag_block(params)
 
         def _setup(self, psr):
-            if method == "sparse":
+            if self._method == "sparse-csc":
                 self._setup_sparse(psr)
 
         def _setup_sparse(self, psr):
-            Ns = scipy.sparse.csc_matrix((len(psr.toas), len(psr.toas)))
-            for key, slices in self._slices.items():
-                for slc in slices:
-                    if slc.stop - slc.start > 1:
-                        Ns[slc, slc] = 1.0
+            # build the fixed block-diagonal sparsity pattern once from COO
+            # triplets; elementwise assignment into an existing CSC matrix
+            # reallocates its structure on every write
+            ntoa = len(psr.toas)
+            rows, cols = [], []
+            for key in self._sorted_keys:
+                for slc in self._slices[key]:
+                    nb = slc.stop - slc.start
+                    ii = np.arange(slc.start, slc.stop)
+                    rows.append(np.repeat(ii, nb))
+                    cols.append(np.tile(ii, nb))
+            if rows:
+                rows, cols = np.concatenate(rows), np.concatenate(cols)
+            else:
+                rows = cols = np.array([], dtype=np.intp)
+            Ns = scipy.sparse.csc_matrix((np.zeros(len(rows)), (rows, cols)), shape=(ntoa, ntoa))
+
+            # record the flat indices into Ns.data covered by each key; the
+            # blocks are disjoint, so each one owns a contiguous data range
+            self._data_idx = {}
+            for key in self._sorted_keys:
+                idxs = [np.arange(Ns.indptr[slc.start], Ns.indptr[slc.stop]) for slc in self._slices[key]]
+                self._data_idx[key] = np.concatenate(idxs) if idxs else np.array([], dtype=np.intp)
+
             self._Ns = signal_base.csc_matrix_alt(Ns)
 
+        def _log10_ecorr_vec(self, params):
+            """Gather the per-key log10 ECORR values into an array."""
+            return np.fromiter(
+                (self.get(key, params) for key in self._sorted_keys),
+                dtype=np.float64,
+                count=len(self._sorted_keys),
+            )
+
+        @signal_base.cache_call("ndiag_params")
         def _get_ndiag_sparse(self, params):
-            for p in self._params:
-                for slc in self._slices[p]:
-                    if slc.stop - slc.start > 1:
-                        self._Ns[slc, slc] = 10 ** (2 * self.get(p, params))
-            return self._Ns
+            vals = 10.0 ** (2.0 * self._log10_ecorr_vec(params))
+            # each cache entry gets its own data array over the shared
+            # (read-only) sparsity structure, so entries stay valid when
+            # parameters revert to a previously cached point
+            data = np.empty_like(self._Ns.data)
+            for key, val in zip(self._sorted_keys, vals):
+                data[self._data_idx[key]] = val
+            return signal_base.csc_matrix_alt((data, self._Ns.indices, self._Ns.indptr), shape=self._Ns.shape)
 
         def _get_ndiag_sherman_morrison(self, params):
             slices, jvec = self._get_jvecs(params)
-            return signal_base.ShermanMorrison(jvec, slices)
+            if self._sm is None:
+                self._sm = signal_base.ShermanMorrison(jvec, slices)
+            else:
+                # rebind rather than write in place: operators derived from
+                # this one (e.g. via __add__) keep their own jvec reference
+                self._sm._jvec = jvec
+            return self._sm
 
         def _get_ndiag_block(self, params):
             slices, jvec = self._get_jvecs(params)
-            blocks = []
-            for jv, slc in zip(jvec, slices):
-                nb = slc.stop - slc.start
-                blocks.append(np.ones((nb, nb)) * jv)
-            return signal_base.BlockMatrix(blocks, slices)
+            # each epoch block is rank one (jv * 1 1^T), so store it as an
+            # (nb, jv) pair instead of materializing a dense nb x nb array
+            blocks = [(slc.stop - slc.start, jv) for jv, slc in zip(jvec, slices)]
+            if self._rank1 is None:
+                self._rank1 = signal_base.RankOneBlockMatrix(blocks, slices)
+            else:
+                self._rank1._blocks = blocks
+            return self._rank1
 
+        @signal_base.cache_call("ndiag_params")
         def _get_jvecs(self, params):
-            slices = sum([self._slices[key] for key in sorted(self._slices.keys())], [])
-            jvec = np.concatenate(
-                [
-                    np.ones(len(self._slices[key])) * 10 ** (2 * self.get(key, params))
-                    for key in sorted(self._slices.keys())
-                ]
-            )
-            return (slices, jvec)
+            jvec = np.repeat(10.0 ** (2.0 * self._log10_ecorr_vec(params)), self._counts)
+            return (self._slice_list, jvec)
 
     return EcorrKernelNoise
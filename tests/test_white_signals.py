@@ -15,7 +15,7 @@ import numpy as np
 import scipy.linalg as sl
 
 from enterprise.pulsar import Pulsar
-from enterprise.signals import gp_signals, parameter, selections, utils, white_signals
+from enterprise.signals import gp_signals, parameter, selections, signal_base, utils, white_signals
 from enterprise.signals.selections import Selection
 from tests.enterprise_test_data import datadir
 
@@ -400,6 +400,10 @@ class TestWhiteSignals(unittest.TestCase):
         """Test of sparse ecorr signal and solve methods."""
         self._ecorr_test(method="sparse")
 
+    def test_ecorr_sparse_csc(self):
+        """Test of sparse-csc ecorr signal and solve methods."""
+        self._ecorr_test(method="sparse-csc")
+
     def test_ecorr_sherman_morrison(self):
         """Test of sherman-morrison ecorr signal and solve methods."""
         self._ecorr_test(method="sherman-morrison")
@@ -408,10 +412,18 @@ class TestWhiteSignals(unittest.TestCase):
         """Test of block matrix ecorr signal and solve methods."""
         self._ecorr_test(method="block")
 
+    def test_ecorr_auto(self):
+        """Test of auto-resolved ecorr signal and solve methods."""
+        self._ecorr_test(method="auto")
+
     def test_ecorr_sparse_ipta(self):
         """Test of sparse ecorr signal and solve methods."""
         self._ecorr_test_ipta(method="sparse")
 
+    def test_ecorr_sparse_csc_ipta(self):
+        """Test of sparse-csc ecorr signal and solve methods."""
+        self._ecorr_test_ipta(method="sparse-csc")
+
     def test_ecorr_sherman_morrison_ipta(self):
         """Test of sherman-morrison ecorr signal and solve methods."""
         self._ecorr_test_ipta(method="sherman-morrison")
@@ -420,6 +432,35 @@ class TestWhiteSignals(unittest.TestCase):
         """Test of block matrix ecorr signal and solve methods."""
         self._ecorr_test_ipta(method="block")
 
+    def test_ecorr_auto_ipta(self):
+        """Test of auto-resolved ecorr signal and solve methods."""
+        self._ecorr_test_ipta(method="auto")
+
+    def test_ecorr_auto_resolution(self):
+        """Test that method='auto' resolves to a concrete method."""
+        selection = Selection(selections.by_backend)
+        ecorr = parameter.Uniform(-10, -5)
+        ec = white_signals.EcorrKernelNoise(log10_ecorr=ecorr, selection=selection, method="auto")
+        ecm = ec(self.psr)
+
+        msg = "auto ECORR method resolved incorrectly."
+        assert ecm._method in ["sherman-morrison", "block"], msg
+
+        ecorrs = [-6.1, -6.2, -6.3, -6.4]
+        params = {
+            "B1855+09_430_ASP_log10_ecorr": ecorrs[0],
+            "B1855+09_430_PUPPI_log10_ecorr": ecorrs[1],
+            "B1855+09_L-wide_ASP_log10_ecorr": ecorrs[2],
+            "B1855+09_L-wide_PUPPI_log10_ecorr": ecorrs[3],
+        }
+        expected = {
+            "sherman-morrison": signal_base.ShermanMorrison,
+            "block": signal_base.RankOneBlockMatrix,
+        }[ecm._method]
+
+        msg = "auto ECORR method dispatched incorrectly."
+        assert isinstance(ecm.get_ndiag(params), expected), msg
+
 
 class TestWhiteSignalsPint(TestWhiteSignals):
     @classmethod